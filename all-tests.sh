@@ -5,6 +5,7 @@ set -xue
 pycodestyle
 python tests/template_pipeline.py make all
 nosetests -v tests/test_import.py
+nosetests -v tests/test_database.py
 nosetests -v tests/test_iotools.py
 nosetests -v tests/test_pipeline_cluster.py
 nosetests -v tests/test_pipeline_control.py
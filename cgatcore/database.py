@@ -9,59 +9,204 @@ Reference
 ---------
 
 '''
+import contextlib
+import csv
+import functools
+import itertools
+import os
+import random
+import threading
+import weakref
 import time
 import re
 import sqlalchemy
+import sqlalchemy.event
 import apsw
-from pandas import DataFrame
+from pandas import (DataFrame, Series, concat, read_csv, read_sql_query,
+                    to_numeric)
+from pandas.errors import EmptyDataError
 
 
-def executewait(dbhandle, statement, regex_error="locked",
-                retries=-1, wait=5):
+# number of rows fetched from a cursor at a time
+ARRAYSIZE = 10000
+
+# sqlite3 connections opened by connect(), cached per thread
+_local = threading.local()
+
+# SQLAlchemy engines created by connect()
+_engines = weakref.WeakSet()
+
+# sqlite result codes signalling lock contention
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+# milliseconds sqlite waits on a locked database before returning
+# SQLITE_BUSY. Contention is handled by sqlite's own busy handler,
+# executewait only retries errors that survive this timeout.
+SQLITE_BUSY_TIMEOUT = 30000
+
+# pragmas applied to every new sqlite connection. The busy timeout
+# lets sqlite itself wait for locks instead of failing immediately
+# with "database is locked". It is set first so that it also applies
+# to switching the journal mode.
+SQLITE_PRAGMAS = ("busy_timeout=%i" % SQLITE_BUSY_TIMEOUT,
+                  "synchronous=NORMAL",
+                  "wal_autocheckpoint=1000")
+
+# switch file-backed sqlite databases to write-ahead logging, which
+# allows readers to proceed concurrently with a writer. The journal
+# mode is stored in the database file. WAL does not work on network
+# file systems, set to False for databases on shared storage.
+SQLITE_WAL = True
+
+# pragmas applied to sqlite connections while bulk loading data in
+# write_DataFrame, trading durability for speed.
+SQLITE_BULK_PRAGMAS = (("synchronous", "OFF"),
+                       ("temp_store", "MEMORY"),
+                       ("cache_size", "-200000"),
+                       ("journal_size_limit", "67108864"))
+
+
+def _is_memory_database(location):
+    """return True if `location` refers to an in-memory sqlite database."""
+    return (location in ("", None, "sqlite://") or
+            location.endswith(":memory:"))
+
+
+def set_sqlite_pragmas(dbhandle, location=None, wal=None):
+    """configure an sqlite connection for concurrent access.
+
+    Applies :data:`SQLITE_PRAGMAS` and switches the journal to
+    write-ahead logging (for file-backed databases only).
+
+    Arguments
+    ---------
+    dbhandle : object
+        A DB-API conform sqlite connection.
+    location : string
+        Path or url of the database. WAL mode is not enabled
+        for in-memory databases.
+    wal : bool
+        Enable WAL mode. Defaults to :data:`SQLITE_WAL`.
+    """
+    if wal is None:
+        wal = SQLITE_WAL
+    cc = dbhandle.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cc.execute("PRAGMA %s" % pragma)
+    if wal and not _is_memory_database(location):
+        cc.execute("PRAGMA journal_mode=WAL")
+    cc.close()
+
+
+# schema statements that can be batched into a single script
+_DDL_RE = re.compile(r"\s*(create|drop|alter|attach|detach)\b", re.I)
+
+# exceptions raised by apsw on lock contention
+_BUSY_EXC = (apsw.BusyError, apsw.LockedError)
+
+# fallback for drivers that do not expose sqlite result codes
+_LOCK_RE = re.compile(
+    "database is locked|database table is locked|database is busy")
+
+
+def _is_locked_error(exc, regex_error=None):
+    """return True if `exc` signals a locked or busy database
+    or its message matches `regex_error`."""
+    if regex_error is not None and re.search(regex_error, str(exc)):
+        return True
+    # sqlalchemy wraps the original DB-API exception
+    orig = getattr(exc, "orig", exc)
+    # sqlite3 (python >= 3.11) and apsw expose the sqlite result code
+    errorcode = getattr(orig, "sqlite_errorcode",
+                        getattr(orig, "result", None))
+    if isinstance(errorcode, int):
+        # mask out extended result codes
+        return (errorcode & 0xff) in (SQLITE_BUSY, SQLITE_LOCKED)
+    return _LOCK_RE.search(str(exc)) is not None
+
+
+def executewait(dbhandle, statement, regex_error=None,
+                retries=-1, wait=1.0, base_wait=0.001):
     '''repeatedly execute an SQL statement until it succeeds.
 
+    Between retries, the procedure sleeps for a random interval drawn
+    uniformly from ``[0, min(wait, base_wait * 2 ** attempt)]``
+    (exponential backoff with full jitter), so that brief lock
+    contention is resolved quickly and concurrent clients do not retry
+    in lock-step.
+
     Arguments
     ---------
     dbhandle : object
         A DB-API conform database handle.
     statement : string
         SQL statement to execute.
-    error : string
-        Exception to catch and examine for error messages.
     regex_error : string
-        Any error message matching `regex_error` will be ignored,
-        otherwise the procedure exists.
+        Errors with a message matching `regex_error` are retried
+        in addition to errors signalling a locked or busy database.
+        All other errors are raised.
     retries : int
         Number of retries. If set to negative number, retry indefinitely.
         If set to 0, there will be only one attempt.
-    wait : int
-        Number of seconds to way between retries.
+    wait : float
+        Maximum number of seconds to wait between retries.
+    base_wait : float
+        Number of seconds to wait before the first retry. The
+        upper bound doubles with every further attempt.
 
     Returns
     -------
     A cursor object
 
     '''
+    execute = dbhandle.execute
+    sleep = time.sleep
+    rng = None
+    attempt = 0
     while 1:
         try:
-            cc = dbhandle.execute(statement)
+            return execute(statement)
+        except _BUSY_EXC:
+            if retries == 0:
+                raise
         except Exception as msg:
             if retries == 0:
                 raise
-            if not re.search("locked", str(msg)):
+            if not _is_locked_error(msg, regex_error):
                 raise
-            time.sleep(wait)
-            retries -= 1
-            continue
-        break
-    return cc
+        if rng is None:
+            rng = random.Random()
+        sleep(rng.uniform(
+            0, min(wait, base_wait * (1 << min(attempt, 20)))))
+        attempt += 1
+        retries -= 1
+
+
+def _quote_identifier(name):
+    """quote an SQL identifier such as a table or column name."""
+    return '"%s"' % name.replace('"', '""')
 
 
 def getColumnNames(dbhandle, table):
     """return column names of a table from a database.
-    """
 
-    cc = executewait(dbhandle, "SELECT * FROM %s LIMIT 1" % table)
+    The column names are read from the schema, no rows are accessed.
+    `table` can be qualified by a schema name, for example
+    ``annotations.genes``.
+    """
+    schema, _, name = table.rpartition(".")
+    name = _quote_identifier(name)
+    if schema:
+        schema = _quote_identifier(schema) + "."
+
+    cc = executewait(dbhandle, f"PRAGMA {schema}table_info({name})")
+    columns = tuple([x[1] for x in cc])
+    if columns:
+        return columns
+
+    # no such table: let the database raise the error
+    cc = executewait(dbhandle, f"SELECT * FROM {schema}{name} LIMIT 1")
     return tuple([x[0] for x in cc.description])
 
 
@@ -76,46 +221,181 @@ def toTSV(dbhandle, outfile, statement, remove_none=True):
     '''execute statement and save as tsv file
     to disk.
 
+    Rows are streamed from the cursor to `outfile` one at a time,
+    so the result set is never held in memory.
+
     If *remove_none* is true, empty/NULL values will be output as
     empty values.
 
     '''
     cc = dbhandle.cursor()
     cc.execute(statement)
-    outfile.write("\t".join([x[0] for x in cc.description]) + "\n")
 
-    def _str(x):
-        if x is None:
-            return ""
-        else:
-            return str(x)
+    # quote characters are output unchanged, as in the input files
+    # read by _getfiledata
+    writer = csv.writer(outfile, delimiter="\t", lineterminator="\n",
+                        quoting=csv.QUOTE_NONE, quotechar=None)
+    writerow = writer.writerow
+    writerow([x[0] for x in cc.description])
 
     if remove_none:
-        f = _str
+        # the csv writer outputs None as an empty string
+        rows = cc
     else:
-        f = str
+        # the csv writer formats all other values like str(),
+        # so only rows containing NULL values need converting
+        rows = (list(map(str, x)) if None in x else x for x in cc)
+
+    for row in rows:
+        try:
+            writerow(row)
+        except csv.Error:
+            # fields containing tabs or newlines can not be written
+            # without quoting, output them unchanged
+            outfile.write("\t".join(
+                ["" if x is None else str(x) for x in row]) + "\n")
+    cc.close()
+
 
-    outfile.write("\n".join(
-        ["\t".join(map(f, x)) for x in cc]))
+def db_execute(cc, statements, params=None):
+    '''excute a statement or statements against a cursor
 
+    If `params` is given, `statements` is a single parameterized
+    statement that is executed once for each parameter set in
+    `params`. Multiple schema statements are submitted as a single
+    script if the cursor supports it and no transaction is open.
+    '''
 
-def db_execute(cc, statements):
-    '''excute a statement or statements against a cursor'''
+    if params is not None:
+        cc.executemany(statements, params)
+        return
 
     if type(statements) not in (list, tuple):
         statements = [statements]
 
+    # executescript commits any pending transaction first, so it
+    # is only used if no transaction is open.
+    if len(statements) > 1 and hasattr(cc, "executescript") and \
+       not cc.connection.in_transaction and \
+       all(_DDL_RE.match(x) for x in statements):
+        cc.executescript(";\n".join(statements))
+        return
+
     for statement in statements:
         cc.execute(statement)
 
 
+@functools.lru_cache(maxsize=32)
+def _create_engine(url):
+    """create an SQLAlchemy engine for `url`.
+
+    Engines maintain their own connection pool, so they are cached
+    and shared across calls to :func:`connect`.
+    """
+    is_sqlite3 = url.startswith("sqlite")
+
+    if is_sqlite3:
+        connect_args = {'check_same_thread': False}
+    else:
+        connect_args = {}
+
+    engine = sqlalchemy.create_engine(
+        url,
+        connect_args=connect_args)
+
+    if is_sqlite3:
+        # apply pragmas to every pooled connection so that
+        # a reconnect does not revert to the default settings
+        @sqlalchemy.event.listens_for(engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            set_sqlite_pragmas(dbapi_connection, url)
+
+    _engines.add(engine)
+    return engine
+
+
+def _connect_sqlite3(location, attach=None):
+    """return an sqlite3 connection to the database at `location`.
+
+    File-backed connections are cached per thread, absolute path
+    and `attach` statements, in-memory databases are always opened
+    afresh. A cached connection with an open transaction is not
+    shared, a separate connection is returned instead.
+    """
+    try:
+        import sqlite3
+    except ImportError:
+        raise ValueError(
+            "If an sqlite database location is passed"
+            " directly the sqlite3 module must be installed")
+
+    if not attach:
+        attach = None
+    elif isinstance(attach, list):
+        attach = tuple(attach)
+    cache = not _is_memory_database(location)
+    if cache and not location.startswith("file:"):
+        # relative paths depend on the working directory
+        location = os.path.abspath(location)
+    key = (location, attach)
+
+    if not hasattr(_local, "connections"):
+        _local.connections = {}
+    dbhandle = _local.connections.get(key)
+    if dbhandle is not None:
+        try:
+            # raises if the connection has been closed
+            in_transaction = dbhandle.in_transaction
+        except sqlite3.ProgrammingError:
+            del _local.connections[key]
+        else:
+            if not in_transaction:
+                return dbhandle
+            # do not hand out another caller's uncommitted changes
+            cache = False
+
+    dbhandle = sqlite3.connect(location, check_same_thread=False)
+    set_sqlite_pragmas(dbhandle, location)
+
+    if attach:
+        db_execute(dbhandle.cursor(), attach)
+
+    if cache:
+        _local.connections[key] = dbhandle
+    return dbhandle
+
+
+def close_all():
+    """close cached database connections.
+
+    Closes the sqlite3 connections cached for the current thread
+    and disposes of the connection pools of all cached SQLAlchemy
+    engines. Uncommitted changes on the cached sqlite3 connections
+    are discarded.
+    """
+    for dbhandle in getattr(_local, "connections", {}).values():
+        dbhandle.close()
+    _local.connections = {}
+
+    for engine in list(_engines):
+        engine.dispose()
+    _engines.clear()
+    _create_engine.cache_clear()
+
+
 def connect(dbhandle=None, attach=None, url=None):
     """attempt to connect to database.
 
-    If `dbhandle` is an existing connection to a database,
-    it will be returned unchanged. Otherwise, this method
+    If `dbhandle` is an existing connection to a database or an
+    SQLAlchemy engine, it will be returned unchanged. Otherwise, this method
     will attempt to establish a connection.
 
+    Connections opened by this method are cached and re-used
+    by subsequent calls within the same thread, see :func:`close_all`.
+    Callers thus share a connection and should commit their changes
+    before connecting again. A cached connection with uncommitted
+    changes is not returned, a new connection is opened instead.
+
     Arguments
     ---------
     url: string
@@ -130,36 +410,22 @@ def connect(dbhandle=None, attach=None, url=None):
     """
 
     if url:
-        is_sqlite3 = url.startswith("sqlite")
-
-        if is_sqlite3:
-            connect_args = {'check_same_thread': False}
-        else:
-            connect_args = {}
-
-        engine = sqlalchemy.create_engine(
-            url,
-            connect_args=connect_args)
-        return engine
+        return _create_engine(url)
 
     if isinstance(dbhandle, str):
-        try:
-            import sqlite3
-        except ImportError:
-            raise ValueError(
-                "If an sqlite database location is passed"
-                " directly the sqlite3 module must be installed")
+        return _connect_sqlite3(dbhandle, attach)
 
-        dbhandle = sqlite3.connect(dbhandle)
+    if isinstance(dbhandle, sqlalchemy.engine.Engine):
+        if attach:
+            raise ValueError(
+                "attach statements can not be applied to the pooled "
+                "connections of an SQLAlchemy engine")
+        return dbhandle
 
     cc = dbhandle.cursor()
 
-    if attach is not None:
-        if isinstance(attach, str):
-            db_execute(cc, attach)
-        elif isinstance(attach, (tuple, list)):
-            for attach_statement in attach:
-                db_execute(cc, attach_statement)
+    if attach:
+        db_execute(cc, attach)
 
     return dbhandle
 
@@ -176,17 +442,66 @@ def execute(queries, dbhandle=None, attach=False):
     cc.close()
 
 
-def fetch(query, dbhandle=None, attach=False):
-    '''Fetch all query results and return'''
+def _execute_one(dbhandle, query):
+    '''execute a single query and return the cursor with its results.
 
+    Uses the execute() shortcut of the connection (sqlite3, apsw)
+    if available to avoid setting up a separate cursor.
+    '''
+    if hasattr(dbhandle, "execute"):
+        return dbhandle.execute(query)
     cc = dbhandle.cursor()
+    cc.execute(query)
+    return cc
 
-    if attach:
-        db_execute(cc, attach)
 
-    sqlresult = cc.execute(query).fetchall()
-    cc.close()
-    return sqlresult
+def _iterate_batches(cc, arraysize=None):
+    '''iterate over the results of an executed cursor in batches
+    of up to `arraysize` rows (default :data:`ARRAYSIZE`).'''
+    if arraysize is None:
+        arraysize = ARRAYSIZE
+    if hasattr(cc, "fetchmany"):
+        fetchmany = cc.fetchmany
+    else:
+        # apsw cursors are iterators without fetchmany()
+        def fetchmany(size):
+            return list(itertools.islice(cc, size))
+    while True:
+        batch = fetchmany(arraysize)
+        if not batch:
+            break
+        yield batch
+
+
+def fetch_iter(query, dbhandle=None, attach=False, arraysize=None):
+    '''Iterate over query results.
+
+    Rows are fetched from the database in batches of `arraysize`
+    rows (default :data:`ARRAYSIZE`) while the iterator is consumed,
+    so the result set is never held in memory as a whole.
+    '''
+
+    if arraysize is None:
+        arraysize = ARRAYSIZE
+
+    dbhandle = connect(dbhandle, attach=attach)
+
+    cc = dbhandle.cursor()
+    if hasattr(cc, "arraysize"):
+        # apsw cursors have no arraysize
+        cc.arraysize = arraysize
+    try:
+        cc.execute(query)
+        for batch in _iterate_batches(cc, arraysize):
+            yield from batch
+    finally:
+        cc.close()
+
+
+def fetch(query, dbhandle=None, attach=False):
+    '''Fetch all query results and return'''
+
+    return list(fetch_iter(query, dbhandle, attach=attach))
 
 
 def fetch_with_names(query,
@@ -199,102 +514,279 @@ def fetch_with_names(query,
 
     dbhandle = connect(dbhandle, attach=attach)
 
-    cc = dbhandle.cursor()
-    sqlresult = cc.execute(query).fetchall()
+    cc = _execute_one(dbhandle, query)
 
-    data = []
     # http://stackoverflow.com/questions/4147707/
     # python-mysqldb-sqlite-result-as-dictionary
-    field_names = [d[0] for d in cc.description]
-    data.append([name for name in field_names])
-    for record in sqlresult:
-        line = [field for field in record]
-        data.append(line)
+    data = [[d[0] for d in cc.description]]
+    for batch in _iterate_batches(cc):
+        data.extend(map(list, batch))
 
     cc.close()
     return data
 
 
+def _connectorx_url(url):
+    """translate a SQLAlchemy url into a url understood by connectorx.
+
+    connectorx does not accept driver-qualified schemes and expects
+    absolute paths for sqlite databases.
+    """
+    url = sqlalchemy.engine.make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return "sqlite://" + os.path.abspath(url.database)
+    return url.set(drivername=backend).render_as_string(
+        hide_password=False)
+
+
 def fetch_DataFrame(query,
                     dbhandle=None,
-                    attach=False):
-    '''Fetch query results and returns them as a pandas dataframe'''
+                    attach=False,
+                    url=None,
+                    engine=None):
+    '''Fetch query results and returns them as a pandas dataframe
+
+    If `url` is given and `engine` is ``"connectorx"``, the query is
+    run by the :mod:`connectorx` package, which reads the results
+    directly into columnar buffers. If connectorx fails, the query is
+    run through SQLAlchemy instead. For SQLAlchemy engines, the
+    results are read by :func:`pandas.read_sql_query`. Otherwise, rows
+    are fetched from a DB-API cursor.
+    '''
 
-    dbhandle = connect(dbhandle, attach=attach)
+    if url is not None and attach:
+        raise ValueError(
+            "attach statements can not be applied when connecting by url")
 
-    cc = dbhandle.cursor()
-    sqlresult = cc.execute(query).fetchall()
-    cc.close()
+    if engine not in (None, "connectorx"):
+        raise ValueError("unknown engine '%s'" % engine)
+
+    if engine == "connectorx":
+        if url is None:
+            raise ValueError("the connectorx engine requires a url")
+        import connectorx
+        try:
+            return connectorx.read_sql(
+                _connectorx_url(url), query, return_type="pandas")
+        except Exception:
+            pass
+
+    if url is not None:
+        dbhandle = connect(url=url)
+    else:
+        dbhandle = connect(dbhandle, attach=attach)
+
+    if isinstance(dbhandle, sqlalchemy.engine.Engine):
+        return read_sql_query(query, dbhandle)
+
+    cc = _execute_one(dbhandle, query)
+    field_names = [d[0] for d in cc.description]
 
     # see http://pandas.pydata.org/pandas-docs/dev/generated/
     # pandas.DataFrame.from_records.html#pandas.DataFrame.from_records
     # this method is design to handle sql_records with proper type
-    # conversion
-
-    field_names = [d[0] for d in cc.description]
+    # conversion. All batches are converted together so that column
+    # types are inferred from the complete result.
     pandas_DataFrame = DataFrame.from_records(
-        sqlresult,
+        itertools.chain.from_iterable(_iterate_batches(cc)),
         columns=field_names)
+    cc.close()
     return pandas_DataFrame
 
 
+_CREATE_INDEX_TEMPLATE = "CREATE INDEX {index} ON {table}({column})"
+
+
+@functools.lru_cache(maxsize=256)
+def _index_statement(tablename, column):
+    '''return statement creating an index on `column` of `tablename`.'''
+    return _CREATE_INDEX_TEMPLATE.format(
+        index=_quote_identifier("%s_%s" % (tablename, column)),
+        table=_quote_identifier(tablename),
+        column=_quote_identifier(column))
+
+
+@contextlib.contextmanager
+def _bulk_load_pragmas(cc):
+    '''temporarily apply :data:`SQLITE_BULK_PRAGMAS` to the
+    sqlite connection of cursor `cc`.
+
+    The pragmas can not be changed within a transaction, so the
+    context needs to enclose the complete transaction.
+    '''
+    previous = []
+    for name, value in SQLITE_BULK_PRAGMAS:
+        cc.execute("PRAGMA %s" % name)
+        previous.append((name, cc.fetchone()[0]))
+    for name, value in SQLITE_BULK_PRAGMAS:
+        cc.execute("PRAGMA %s=%s" % (name, value))
+    try:
+        yield
+    finally:
+        for name, value in previous:
+            cc.execute("PRAGMA %s=%s" % (name, value))
+
+
 def write_DataFrame(dataframe,
                     tablename,
                     dbhandle=None,
                     index=False,
-                    if_exists='replace'):
+                    if_exists='replace',
+                    bulk=True):
     '''write a pandas dataframe to an sqlite db, index on given columns
        index columns given as a string or list eg. "gene_id" or
        ["gene_id", "start"]
 
+    Data and indices are written within an explicit transaction so
+    that the database is not synced to disk after every statement.
+
+    If `bulk` is set and the database is sqlite, disk syncs are
+    switched off and the page cache is enlarged while loading (see
+    :data:`SQLITE_BULK_PRAGMAS`). Set `bulk` to False if the database
+    must not be corrupted by a power loss or OS crash during loading.
     '''
 
     dbhandle = connect(dbhandle)
 
-    dataframe.to_sql(tablename,
-                     con=dbhandle,
-                     flavor='sqlite',
-                     if_exists=if_exists)
-
-    def indexStat(tablename, column):
-        istat = ('create index %(tablename)s_%(column)s '
-                 'on %(tablename)s(%(column)s)') % locals()
-        return istat
-
-    if index:
-
-        cc = dbhandle.cursor()
-
-        if isinstance(index, str):
-            istat = indexStat(tablename, index)
-            print(istat)
-            db_execute(cc, istat)
-        elif isinstance(index, (tuple, list)):
-            for column in index:
-                istat = indexStat(tablename, column)
-                db_execute(cc, istat)
+    if not index:
+        index_columns = []
+    elif isinstance(index, str):
+        index_columns = [index]
+    else:
+        index_columns = list(index)
+
+    # sqlite treats unknown quoted identifiers as string literals,
+    # so check the columns before creating any indices. The
+    # dataframe index is written under the names used by pandas.
+    names = dataframe.index.names
+    if len(names) == 1:
+        index_names = [names[0] or "index"]
+    else:
+        index_names = [x or "level_%i" % i for i, x in enumerate(names)]
+    missing = set(index_columns).difference(
+        list(dataframe.columns) + index_names)
+    if missing:
+        raise ValueError("can not create index on missing column(s) %s" %
+                         ", ".join(sorted(missing)))
+
+    if isinstance(dbhandle, sqlalchemy.engine.Engine):
+        bulk = bulk and dbhandle.dialect.name == "sqlite"
+        with dbhandle.connect() as connection:
+            cc = connection.connection.cursor()
+            with (_bulk_load_pragmas(cc) if bulk
+                  else contextlib.nullcontext()):
+                # pandas does not commit if the connection is already
+                # within a transaction, so everything is committed once
+                with connection.begin():
+                    dataframe.to_sql(tablename,
+                                     con=connection,
+                                     if_exists=if_exists,
+                                     chunksize=1000)
+                    for column in index_columns:
+                        statement = _index_statement(tablename, column)
+                        connection.execute(sqlalchemy.text(statement))
+            cc.close()
+        return
+
+    # pandas commits by itself on DB-API connections. Take the
+    # write lock up front so that sqlite does not need to upgrade
+    # the lock (and possibly fail with SQLITE_BUSY) mid-transaction.
+    def begin(cc):
+        if not getattr(dbhandle, "in_transaction", False):
+            cc.execute("BEGIN IMMEDIATE")
+
+    bulk = (bulk and type(dbhandle).__module__ == "sqlite3" and
+            not dbhandle.in_transaction)
 
+    cc = dbhandle.cursor()
+    try:
+        with (_bulk_load_pragmas(cc) if bulk
+              else contextlib.nullcontext()):
+            try:
+                begin(cc)
+                dataframe.to_sql(tablename,
+                                 con=dbhandle,
+                                 if_exists=if_exists,
+                                 chunksize=1000)
+
+                if index_columns:
+                    begin(cc)
+                    for column in index_columns:
+                        cc.execute(_index_statement(tablename, column))
+                dbhandle.commit()
+            except Exception:
+                dbhandle.rollback()
+                raise
+    finally:
         cc.close()
 
 
 def _getfiledata(path):
     '''
-    pull out the column and data information from the tsv file
+    read the tsv files in `path` into a single dataframe of strings
     in preperation for loading to virtual table.
+
+    The column names are taken from the header of the first file,
+    the header lines of all files are skipped. Empty files are
+    ignored. Columns missing in later files are filled with NULL,
+    additional columns are dropped. Empty fields are read as NULL,
+    all other values are kept as they are.
     '''
+    frames = []
     columns = None
-    data = []
-    counter = 1
     for p in path:
-        with open(p, "r") as infile:
-            for line in infile:
-                counter += 1
+        try:
+            frame = read_csv(p, sep="\t", engine="c", memory_map=True,
+                             quoting=csv.QUOTE_NONE, dtype=str,
+                             keep_default_na=False, na_values=[""],
+                             index_col=False)
+        except EmptyDataError:
+            continue
+        if columns is None:
+            columns = frame.columns
+        else:
+            ncolumns = min(len(frame.columns), len(columns))
+            frame = frame.iloc[:, :ncolumns].set_axis(
+                columns[:ncolumns], axis=1).reindex(columns=columns)
+        frames.append(frame)
 
-                if columns is None:
-                    columns = line
+    if not frames:
+        return DataFrame()
+    elif len(frames) == 1:
+        return frames[0]
+    return concat(frames, ignore_index=True)
 
-                data.append(line.replace("\t", ",").strip().split(','))
-    return columns, data
+
+def _convert_column(column):
+    '''convert a column of strings read by :func:`_getfiledata`.
+
+    A column is converted to INTEGER only if all its values are
+    unchanged when converted back to a string, so that values such
+    as ``007`` remain text. A column is converted to REAL if all its
+    values can be parsed as floating point numbers.
+
+    Returns
+    -------
+    values : array
+        The column values.
+    type : string
+        The sqlite type of the column.
+    '''
+    values = column.dropna()
+    if len(values):
+        numeric = to_numeric(values, errors="coerce")
+        kind = numeric.dtype.kind
+        if kind == "f" and not numeric.isna().any():
+            return to_numeric(column).to_numpy(), "REAL"
+        elif kind in "iu" and (numeric.astype(str) == values).all():
+            if len(values) == len(column):
+                return numeric.to_numpy(), "INTEGER"
+            # keep python integers, missing values are NULL
+            result = Series(None, index=column.index, dtype=object)
+            result[numeric.index] = numeric.astype(object)
+            return result.to_numpy(), "INTEGER"
+    return column.to_numpy(dtype=object), "TEXT"
 
 
 def apsw_connect(dbname=None, modname="tsv"):
@@ -318,6 +810,7 @@ def apsw_connect(dbname=None, modname="tsv"):
     '''
 
     connection = apsw.Connection(dbname)
+    connection.setbusytimeout(SQLITE_BUSY_TIMEOUT)
 
     cursor = connection.cursor()
 
@@ -331,19 +824,29 @@ class _VirtualTable:
     Create a virtual table from  a tsv file.
     '''
     def Create(self, db, modulename, dbname, tablename, *args):
-        columns, data = _getfiledata([x for x in args])
-        columns = ['%s' % (x, ) for x in columns.split()]
-        schema = "create table foo(" + ','.join(["'%s'" % x for x in columns]) + ")"
+        dataframe = _getfiledata([x for x in args])
+        columns = [str(x) for x in dataframe.columns]
+
+        # store data column-wise as numpy arrays
+        cols, types = [], []
+        for x in range(len(columns)):
+            values, sqltype = _convert_column(dataframe.iloc[:, x])
+            cols.append(values)
+            types.append(sqltype)
 
-        return schema, _Table(columns, data)
+        schema = "create table foo(" + ','.join(
+            ["'%s' %s" % x for x in zip(columns, types)]) + ")"
+
+        return schema, _Table(columns, cols)
     Connect = Create
 
 
 # Represents a table
 class _Table:
-    def __init__(self, columns, data):
+    def __init__(self, columns, cols):
         self.columns = columns
-        self.data = data
+        self.cols = cols
+        self.nrows = len(cols[0]) if cols else 0
 
     def BestIndex(self, *args):
         return None
@@ -366,14 +869,22 @@ class _Cursor:
         self.pos = 0
 
     def Eof(self):
-        return self.pos >= len(self.table.data)
+        return self.pos >= self.table.nrows
 
     def Rowid(self):
-        return self.table.data[self.pos][0]
+        return self.pos
 
     def Column(self, col):
-
-        return self.table.data[self.pos][col]
+        if col == -1:
+            return self.pos
+        value = self.table.cols[col][self.pos]
+        if hasattr(value, "item"):
+            # convert numpy scalars to python types
+            value = value.item()
+        if value != value:
+            # missing values are read as NaN
+            return None
+        return value
 
     def Next(self):
         self.pos += 1